@@ -0,0 +1,123 @@
+"""Nested vs flat photo table: LibreOffice headless conversion benchmark.
+
+Ek hi synthetic report dono layouts ("nested" aur "flat") mein banata hai aur
+LibreOffice se headless PDF conversion ka time naapta hai (open + paginate ka
+proxy). Saath mein build time, file size aur nested tables ki ginti bhi deta hai.
+
+Usage:
+    python bench_layout.py --photos 500
+    python bench_layout.py --photos 500 --runs 3 --soffice /usr/bin/soffice
+"""
+import argparse
+import datetime
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# veda.py ka __main__ block dobara `streamlit run` na chalaye
+os.environ["STREAMLIT_IS_RUNNING"] = "true"
+
+from docx import Document
+
+import veda
+from load_test import SyntheticUpload, make_photo
+
+LAYOUTS = ("nested", "flat")
+
+
+def make_report(photos, side_per_photo, width, height, layout):
+    entries = {}
+    captions = veda.caption_options
+    for i in range(photos // (1 + side_per_photo)):
+        main = SyntheticUpload(make_photo(i, width, height), f"p{i}.jpg", f"bench-p{i}")
+        side = [SyntheticUpload(make_photo(i * 10 + j + 1, width, height), f"p{i}_s{j}.jpg", f"bench-p{i}-s{j}")
+                for j in range(side_per_photo)]
+        entries[i] = {"caption": captions[i % len(captions)], "status": "Completed",
+                      "img1": main, "sec_imgs": side}
+    return {
+        "p_name": "Bench Project", "p_num": "27AAA", "p_loc": "Mumbai", "p_precert": "Gold",
+        "p_area": "50,000 Sq. m.", "p_units": "450", "p_afford": "50",
+        "p_date": datetime.date(2026, 1, 1),
+        "towers_list": [{"name": "Tower A", "floors": "G + 45", "stage": "40%"}],
+        "entries_data": entries,
+        "logo_left": None, "logo_right": None,
+        "header_center_text": "", "main_body_title": "IGBC Six Monthly Compliance Report",
+        "header_color_input": "#48B448", "uploaded_template": None,
+        "optimize_template": False, "renditions": ("light",), "layout": layout,
+    }
+
+
+def table_counts(docx_bytes):
+    body = Document(io.BytesIO(docx_bytes)).element.body
+    return len(body.xpath("./w:tbl")), len(body.xpath(".//w:tc//w:tbl"))
+
+
+def convert_seconds(soffice, docx_path, out_dir, profile_dir):
+    cmd = [soffice, f"-env:UserInstallation=file://{profile_dir}", "--headless",
+           "--convert-to", "pdf", "--outdir", out_dir, docx_path]
+    t0 = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nested vs flat layout: LibreOffice conversion time")
+    parser.add_argument("--photos", type=int, default=500)
+    parser.add_argument("--side-photos", type=int, default=1, help="side photos per main photo")
+    parser.add_argument("--width", type=int, default=1200)
+    parser.add_argument("--height", type=int, default=900)
+    parser.add_argument("--runs", type=int, default=3, help="conversions per layout")
+    parser.add_argument("--soffice", default=shutil.which("soffice") or shutil.which("libreoffice"))
+    parser.add_argument("--keep", help="copy the generated .docx files into this directory")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="dengine_bench_")
+    profile = os.path.join(work, "lo_profile")
+    rows = []
+    for layout in LAYOUTS:
+        report = make_report(args.photos, args.side_photos, args.width, args.height, layout)
+        # Photos pehle hi decode ho jaayein, taaki build time sirf layout ka ho
+        for entry in report["entries_data"].values():
+            for f in [entry["img1"]] + entry["sec_imgs"]:
+                veda.prefetch_image(f)
+        for entry in report["entries_data"].values():
+            for f in [entry["img1"]] + entry["sec_imgs"]:
+                veda.get_processed_image(f)
+
+        t0 = time.perf_counter()
+        outputs, failures = veda.build_report_docx(report)
+        build_s = time.perf_counter() - t0
+        docx_bytes = outputs["light"]
+        path = os.path.join(work, f"report_{layout}.docx")
+        with open(path, "wb") as f:
+            f.write(docx_bytes)
+        if args.keep:
+            os.makedirs(args.keep, exist_ok=True)
+            shutil.copy(path, args.keep)
+
+        top_level, nested = table_counts(docx_bytes)
+        convert = []
+        if args.soffice:
+            convert_seconds(args.soffice, path, work, profile)  # warm-up (profile + fonts)
+            convert = [convert_seconds(args.soffice, path, work, profile) for _ in range(args.runs)]
+        rows.append((layout, build_s, len(docx_bytes) / 1e6, top_level, nested, convert, len(failures)))
+
+    print(f"\n{args.photos} photos, {args.side_photos} side photo(s) per entry")
+    print(f"{'layout':<8}{'build s':>9}{'MB':>7}{'tables':>8}{'nested':>8}{'convert s (median)':>20}{'min':>8}")
+    for layout, build_s, mb, top_level, nested, convert, failed in rows:
+        med = f"{statistics.median(convert):.2f}" if convert else "-"
+        low = f"{min(convert):.2f}" if convert else "-"
+        print(f"{layout:<8}{build_s:>9.2f}{mb:>7.2f}{top_level:>8}{nested:>8}{med:>20}{low:>8}")
+    if not args.soffice:
+        print("LibreOffice (soffice) not found: conversion times skipped. Use --soffice PATH.")
+    shutil.rmtree(work, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""Sandboxed photo decoding for veda.py.
+
+Photos ek chhote persistent worker pool mein decode hote hain. Workers
+forkserver (Windows par spawn) se start hote hain, yaani kabhi bhi
+multi-threaded Streamlit server ko fork nahi kiya jaata. Har worker par
+memory limit aur pixel ceiling lagti hai; timeout ya crash par worker
+maar ke naya start hota hai.
+
+Ye module jaan-boojh kar Streamlit import nahi karta, taaki worker processes
+ise seedha import kar sakein. Workers app script (__main__) ko bhi import nahi
+karte, dekho _start_process.
+"""
+import io
+import os
+import sys
+import queue
+import types
+import threading
+import multiprocessing
+
+from PIL import Image, UnidentifiedImageError
+try:
+    import resource  # sirf Unix par
+except ImportError:
+    resource = None
+
+# Ek hi decode se kai renditions:
+#   "light"   - report cell ke size par PNG (portal / email copy)
+#   "archive" - full-resolution JPEG (archive copy); JPEG original bina badle
+ARCHIVE_JPEG_QUALITY = 92
+# Pillow kai phone JPEGs ko MPO ke roop mein padhta hai; file phir bhi JPEG hi hai
+PASSTHROUGH_FORMATS = ("JPEG", "MPO")
+EXIF_ORIENTATION = 0x0112
+
+
+def render_image_renditions(img_file,
+                            land_w=4.25, land_h=2.25,
+                            port_w=3.6, port_h=2.03,
+                            max_pixels=None, renditions=("light",)):
+    img = Image.open(img_file)
+    # Decode se pehle hi size check (header se), taaki decompression bomb load na ho
+    if max_pixels and img.size[0] * img.size[1] > max_pixels:
+        raise ValueError(
+            f"{img.size[0]}x{img.size[1]} px exceeds the {max_pixels / 1_000_000:g} MP limit"
+        )
+    out = {}
+
+    # JPEG original hi archive copy hai: dobara encode karne se quality aur EXIF dono jaate.
+    # Rotated (EXIF orientation) photos re-encode hoti hain, taaki light copy jaisi hi dikhein
+    if ("archive" in renditions and img.format in PASSTHROUGH_FORMATS
+            and img.getexif().get(EXIF_ORIENTATION, 1) == 1):
+        img_file.seek(0)
+        out["archive"] = io.BytesIO(img_file.read())
+        if "light" not in renditions:
+            return out
+
+    img = img.convert("RGB")
+
+    if "archive" in renditions and "archive" not in out:
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=ARCHIVE_JPEG_QUALITY)
+        buf.seek(0)
+        out["archive"] = buf
+        if "light" not in renditions:
+            return out
+
+    w_px, h_px = img.size
+    aspect = w_px / h_px
+    DPI = 96
+
+    # 🎯 LANDSCAPE IMAGE
+    if aspect >= 1:
+        max_w_px = int(land_w * DPI)
+        max_h_px = int(land_h * DPI)
+
+        scale = min(max_w_px / w_px, max_h_px / h_px)
+
+    # 🎯 PORTRAIT IMAGE
+    else:
+        max_w_px = int(port_w * DPI)
+        max_h_px = int(port_h * DPI)
+
+        scale = min(max_w_px / w_px, max_h_px / h_px)
+
+    new_w = int(w_px * scale)
+    new_h = int(h_px * scale)
+
+    img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    buf.seek(0)
+    out["light"] = buf
+    return out
+
+
+def decode_image(data, land_w, land_h, renditions, max_pixels=None, memory_mb=0):
+    # Returns ({rendition: bytes}, None) ya (None, error message)
+    try:
+        bufs = render_image_renditions(io.BytesIO(data), land_w, land_h,
+                                       max_pixels=max_pixels, renditions=renditions)
+        return {name: buf.getvalue() for name, buf in bufs.items()}, None
+    except MemoryError:
+        return None, f"memory limit exceeded ({memory_mb} MB)"
+    except UnidentifiedImageError:
+        return None, "not a recognised image format"
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _current_vm_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _worker_main(conn, memory_mb, max_pixels):
+    if resource is not None and memory_mb > 0:
+        # Interpreter + PIL pehle se mapped hain, uske upar limit lagao
+        limit = _current_vm_bytes() + memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass
+    # Pixel ceiling sirf max_pixels hai (render_image_renditions header se check karta hai);
+    # Pillow ka apna bomb check / warning yahan band
+    Image.MAX_IMAGE_PIXELS = None
+    while True:
+        try:
+            data, land_w, land_h, renditions = conn.recv()
+        except (EOFError, OSError):
+            return
+        conn.send(decode_image(data, land_w, land_h, renditions, max_pixels, memory_mb))
+
+
+def _worker_context():
+    try:
+        ctx = multiprocessing.get_context("forkserver")
+    except ValueError:  # Windows
+        return multiprocessing.get_context("spawn")
+    ctx.set_forkserver_preload([__name__])
+    return ctx
+
+
+# Spawn / forkserver child process parent ka __main__ dobara import karta hai. Streamlit mein
+# __main__ khud app script hota hai, yaani har worker poori app bare mode mein chala deta
+# (dheema, aur har st.* call par "missing ScriptRunContext" warning). Start ke waqt
+# __main__ ki jagah ek khaali module rakhte hain, jiska koi file nahi.
+_START_LOCK = threading.Lock()
+_BARE_MAIN = types.ModuleType("__main__")
+
+
+def _start_process(proc):
+    with _START_LOCK:
+        main = sys.modules.get("__main__")
+        sys.modules["__main__"] = _BARE_MAIN
+        try:
+            proc.start()
+        finally:
+            # Beech mein Streamlit ne naya script module set kiya ho to wahi rehne do
+            if sys.modules.get("__main__") is _BARE_MAIN:
+                sys.modules["__main__"] = main
+
+
+class _Worker:
+    def __init__(self, ctx, memory_mb, max_pixels):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn, memory_mb, max_pixels), daemon=True)
+        _start_process(self.proc)
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self):
+        self.conn.close()
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join()
+
+
+class DecoderPool:
+    """Persistent decode workers, kai threads se ek saath use ho sakta hai."""
+
+    def __init__(self, size, timeout_s, memory_mb, max_pixels, max_tasks=200):
+        self.timeout_s = timeout_s
+        self.memory_mb = memory_mb
+        self.max_pixels = max_pixels
+        self.max_tasks = max_tasks
+        self._ctx = _worker_context()
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._start())
+
+    def _start(self):
+        return _Worker(self._ctx, self.memory_mb, self.max_pixels)
+
+    def _replace(self, worker):
+        if worker is not None:
+            worker.stop()
+        try:
+            return self._start()
+        except Exception:
+            return None  # agla decode() dobara koshish karega
+
+    def decode(self, data, land_w, land_h, renditions):
+        # Returns (images ya None, error ya None, transient)
+        # transient=True: timeout / crash - dobara try karne par chal sakta hai
+        worker = self._idle.get()
+        if worker is None or not worker.proc.is_alive():
+            worker = self._replace(worker)
+            if worker is None:
+                self._idle.put(None)
+                return None, "could not start a decoder process", True
+
+        recycle = True
+        try:
+            worker.conn.send((data, land_w, land_h, tuple(renditions)))
+            if not worker.conn.poll(self.timeout_s):
+                return None, f"timed out after {self.timeout_s:g}s", True
+            images, error = worker.conn.recv()
+            worker.tasks += 1
+            # Error ke baad (MemoryError etc.) worker ki state par bharosa nahi
+            recycle = error is not None or worker.tasks >= self.max_tasks
+            return images, error, False
+        except (EOFError, OSError):
+            worker.proc.join(1)
+            return None, f"decoder crashed (exit code {worker.proc.exitcode})", True
+        finally:
+            self._idle.put(self._replace(worker) if recycle else worker)
@@ -0,0 +1,326 @@
+"""Offline load test for veda.py.
+
+N simulated sessions ko Streamlit ke AppTest API se headless chalata hai,
+synthetic photos upload karta hai aur ye numbers nikalta hai:
+  - har widget interaction (caption / status change) ka rerun latency
+  - GENERATE REPORT latency (cold + cache hit) ke percentiles
+  - memory (RSS, saare processes ka total) time ke saath - sirf Linux par (/proc)
+
+Usage:
+    python load_test.py --sessions 5 --photos 300
+    python load_test.py --sessions 2 --photos 20 --json results.json
+
+AppTest file_uploader ko support nahi karta, isliye st.file_uploader ko yahan
+patch karke har session ko uski apni synthetic uploads di jaati hain.
+
+AppTest har run ke liye ek process-global Runtime banata hai, isliye har session
+apne alag process mein chalta hai aur unke reruns sach mein ek saath chalte hain.
+Iska matlab: image / report caches aur decoder pool har session ke apne hain
+(asli server mein ye sab sessions ke beech shared hote hain), aur memory saare
+processes (decoder workers samet) ka total hai, ek server process ki nahi.
+GENERATE ke baad st.error ya download button na milna bhi error gina jaata hai.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from PIL import Image
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "veda.py")
+
+CAPTIONS = [
+    "Existing site conditions", "Green cover on site & irrigation system",
+    "Rainwater Harvesting / recharge pit construction", "Reference Photographs",
+]
+STATUSES = ["Completed", "In Progress", "To be initiated", "Pending"]
+
+
+class SyntheticUpload(io.BytesIO):
+    # streamlit UploadedFile jaisa hi interface (name, file_id, type, size)
+    def __init__(self, data, name, file_id, mime="image/jpeg"):
+        super().__init__(data)
+        self.name = name
+        self.file_id = file_id
+        self.type = mime
+        self.size = len(data)
+
+
+def make_photo(seed, width, height):
+    # Noise + random colour, taaki JPEG size aur har photo ka hash asli jaisa alag ho
+    rnd = random.Random(seed)
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    tint = Image.new("RGB", (width, height), tuple(rnd.randrange(256) for _ in range(3)))
+    img = Image.blend(noise, tint, 0.6)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def make_session_uploads(session_idx, photos, side_per_photo, width, height):
+    main, side = [], {}
+    for i in range(photos):
+        seed = session_idx * 100_000 + i
+        main.append(SyntheticUpload(make_photo(seed, width, height), f"s{session_idx}_p{i}.jpg", f"s{session_idx}-p{i}"))
+        side[f"sec_{i}"] = [
+            SyntheticUpload(make_photo(seed * 10 + j + 1, width, height),
+                            f"s{session_idx}_p{i}_side{j}.jpg", f"s{session_idx}-p{i}-s{j}")
+            for j in range(side_per_photo)
+        ]
+    return main, side
+
+
+def install_fake_uploader(main, side):
+    import streamlit as st
+
+    def fake_file_uploader(label, type=None, accept_multiple_files=False, key=None, **kwargs):
+        if label.startswith("📂"):
+            return main
+        if key in side:
+            return side[key]
+        return [] if accept_multiple_files else None
+
+    st.file_uploader = fake_file_uploader
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    return {
+        "n": len(values), "p50": pick(0.50), "p90": pick(0.90),
+        "p95": pick(0.95), "max": values[-1], "mean": sum(values) / len(values),
+    }
+
+
+def process_tree(root_pid):
+    # root_pid aur uske saare descendants (session processes, forkserver, decoder workers)
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    pids, todo = [], [root_pid]
+    while todo:
+        pid = todo.pop()
+        pids.append(pid)
+        todo.extend(children.get(pid, []))
+    return pids
+
+
+# Process tree ka current RSS sirf /proc se milta hai. getrusage ka ru_maxrss peak hai (current nahi),
+# RUSAGE_CHILDREN sirf exit ho chuke children ginta hai aur macOS par bytes deta hai - isliye
+# /proc ke bina memory naapi hi nahi jaati
+HAVE_PROC = os.path.isdir("/proc/self")
+
+
+def rss_mb():
+    # Poore process tree ka RSS total
+    total = 0
+    for pid in process_tree(os.getpid()):
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1])
+        except (OSError, ValueError):
+            continue  # process beech mein exit ho gaya
+    return total * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+        self._t0 = time.perf_counter()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append((round(time.perf_counter() - self._t0, 2), round(rss_mb(), 1)))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_session(session_idx, args, start_barrier, results):
+    # Alag process mein chalta hai; timings + errors (crash samet) results queue mein
+    timings = {"initial": [], "rerun": [], "generate_cold": [], "generate_cached": []}
+    errors = []
+    try:
+        _run_session(session_idx, args, start_barrier, timings, errors)
+    except Exception as e:
+        errors.append(f"session {session_idx}: {type(e).__name__}: {e}")
+    results.put((session_idx, {"timings": timings, "errors": errors}))
+
+
+def _run_session(session_idx, args, start_barrier, timings, errors):
+    from streamlit.testing.v1 import AppTest
+
+    install_fake_uploader(*make_session_uploads(session_idx, args.photos, args.side_photos,
+                                                args.width, args.height))
+    rnd = random.Random(session_idx)
+
+    def timed(bucket, at):
+        t0 = time.perf_counter()
+        at.run(timeout=args.timeout)
+        if bucket:
+            timings[bucket].append(time.perf_counter() - t0)
+        if at.exception:
+            errors.append(f"session {session_idx}: {at.exception[0].message}")
+
+    def generate(bucket, at):
+        at.button[0].click()
+        timed(bucket, at)
+        # Exception ke bina bhi generation toot sakti hai: st.error ya download button gayab
+        if at.error:
+            errors.append(f"session {session_idx} {bucket}: {at.error[0].value}")
+        elif not at.get("download_button"):
+            errors.append(f"session {session_idx} {bucket}: no download button")
+
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    # Sab sessions uploads bana kar ek saath shuru hon
+    start_barrier.wait()
+    timed("initial", at)
+
+    # Kuch photos par ek-ek karke caption / status badlo (real user jaisa)
+    for i in range(min(args.interactions, args.photos)):
+        if i % 2 == 0:
+            at.selectbox(key=f"c_sel_{i}").set_value(rnd.choice(CAPTIONS))
+        else:
+            at.selectbox(key=f"s_{i}").set_value(rnd.choice(STATUSES))
+        timed("rerun", at)
+
+    # Baaki sab captions ek saath, taaki poori report bane
+    for i in range(args.photos):
+        sel = at.selectbox(key=f"c_sel_{i}")
+        if sel.value == "Select Caption...":
+            sel.set_value(rnd.choice(CAPTIONS))
+    timed(None, at)
+
+    generate("generate_cold", at)
+    for _ in range(args.repeat_generate):
+        generate("generate_cached", at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for veda.py")
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--photos", type=int, default=300, help="main photos per session")
+    parser.add_argument("--side-photos", type=int, default=0, help="side photos per main photo")
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--height", type=int, default=1500)
+    parser.add_argument("--interactions", type=int, default=10, help="measured widget changes per session")
+    parser.add_argument("--repeat-generate", type=int, default=1, help="extra GENERATE clicks with same inputs")
+    parser.add_argument("--timeout", type=float, default=1800, help="per-rerun timeout (s)")
+    parser.add_argument("--mem-interval", type=float, default=0.5)
+    parser.add_argument("--json", help="write raw results to this file")
+    parser.add_argument("--max-rerun-p95", type=float, help="fail if rerun p95 (s) is above this")
+    parser.add_argument("--max-generate-p95", type=float, help="fail if cold generate p95 (s) is above this")
+    parser.add_argument("--max-peak-mb", type=float, help="fail if peak RSS (MB) is above this")
+    args = parser.parse_args()
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    # veda.py ka __main__ block dobara `streamlit run` na chalaye
+    os.environ["STREAMLIT_IS_RUNNING"] = "true"
+    # App .streamlit/config.toml likhta hai; repo ko saaf rakhne ke liye temp dir mein chalao
+    os.chdir(tempfile.mkdtemp(prefix="dengine_load_"))
+
+    print(f"Starting {args.sessions} session processes, {args.photos} photos each ...")
+    # spawn: har session ek saaf interpreter mein (apna Streamlit Runtime aur caches)
+    ctx = multiprocessing.get_context("spawn")
+    start_barrier = ctx.Barrier(args.sessions + 1)
+    result_queue = ctx.Queue()
+    procs = [ctx.Process(target=run_session, args=(s, args, start_barrier, result_queue))
+             for s in range(args.sessions)]
+    for p in procs:
+        p.start()
+    try:
+        start_barrier.wait(timeout=args.timeout)
+    except threading.BrokenBarrierError:
+        print("Not all sessions started in time; measuring the ones that did.")
+
+    sampler = MemorySampler(args.mem_interval)
+    if HAVE_PROC:
+        sampler.start()
+    results = {}
+    t0 = time.perf_counter()
+    while len(results) < args.sessions:
+        try:
+            session_idx, result = result_queue.get(timeout=1)
+        except queue.Empty:
+            if not any(p.is_alive() for p in procs):
+                break
+            continue
+        results[session_idx] = result
+    wall = time.perf_counter() - t0
+    if HAVE_PROC:
+        sampler.stop()
+    for p in procs:
+        p.join(timeout=5)
+        if p.is_alive():
+            p.kill()
+
+    summary = {}
+    for bucket in ("initial", "rerun", "generate_cold", "generate_cached"):
+        summary[bucket] = percentiles([v for r in results.values() for v in r["timings"].get(bucket, [])])
+    mem = [m for _, m in sampler.samples]
+    summary["memory_mb"] = {"start": mem[0], "peak": max(mem), "end": mem[-1]} if mem else {}
+    errors = [e for r in results.values() for e in r["errors"]]
+    errors += [f"session {s} did not finish" for s in range(args.sessions) if s not in results]
+
+    print(f"\n{args.sessions} sessions x {args.photos} photos, wall time {wall:.1f}s")
+    print(f"{'latency (s)':<18}{'n':>5}{'p50':>9}{'p90':>9}{'p95':>9}{'max':>9}")
+    for bucket in ("initial", "rerun", "generate_cold", "generate_cached"):
+        p = summary[bucket]
+        if p:
+            print(f"{bucket:<18}{p['n']:>5}{p['p50']:>9.2f}{p['p90']:>9.2f}{p['p95']:>9.2f}{p['max']:>9.2f}")
+    if mem:
+        m = summary["memory_mb"]
+        print(f"RSS MB: start {m['start']:.0f}, peak {m['peak']:.0f}, end {m['end']:.0f}")
+    elif not HAVE_PROC:
+        print("RSS MB: not measured (needs Linux /proc)")
+    if errors:
+        print(f"{len(errors)} error(s), first: {errors[0]}")
+
+    # Regression gates
+    failed = []
+    limits = [("rerun p95", summary["rerun"].get("p95"), args.max_rerun_p95),
+              ("generate p95", summary["generate_cold"].get("p95"), args.max_generate_p95),
+              ("peak RSS MB", summary["memory_mb"].get("peak"), args.max_peak_mb)]
+    for name, value, limit in limits:
+        if limit is not None and value is not None and value > limit:
+            failed.append(f"{name} {value:.2f} > {limit:g}")
+    for msg in failed:
+        print(f"FAIL: {msg}")
+    if args.max_peak_mb is not None and not mem:
+        print("Note: --max-peak-mb was not checked, memory was not measured")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "wall_s": wall, "summary": summary,
+                       "memory_timeline": sampler.samples, "errors": errors,
+                       "failed": failed}, f, indent=2)
+    return 1 if errors or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
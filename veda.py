@@ -4,11 +4,19 @@ import subprocess
 import io
 import math
 import base64
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+import image_worker
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 import streamlit as st
 from docx import Document
+from docx.parts.image import ImagePart
+from docx.opc.packuri import PackURI
+from docx.opc.constants import CONTENT_TYPE as CT
 from docx.shared import Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_ALIGN_VERTICAL, WD_TABLE_ALIGNMENT
@@ -163,47 +171,772 @@ def make_row_cant_split(row):
     cantSplit.set(qn('w:val'), 'true')
     trPr.append(cantSplit)
 
+def hide_cell_borders(cell, *sides):
+    tc_pr = cell._tc.get_or_add_tcPr()
+    tc_borders = OxmlElement('w:tcBorders')
+    for side in sides:
+        node = OxmlElement(f'w:{side}')
+        node.set(qn('w:val'), 'nil')
+        tc_borders.append(node)
+    # Schema order: tcBorders, shd/noWrap/tcMar/.../vAlign se pehle aana chahiye
+    for tag in ('w:shd', 'w:noWrap', 'w:tcMar', 'w:textDirection', 'w:tcFitText', 'w:vAlign', 'w:hideMark'):
+        later = tc_pr.find(qn(tag))
+        if later is not None:
+            later.addprevious(tc_borders)
+            return
+    tc_pr.append(tc_borders)
+
+
+
+# --- BACKGROUND IMAGE PREPROCESSING ---
+# Photos upload hote hi resize background mein shuru ho jata hai,
+# taaki GENERATE dabane tak zyada tar kaam ho chuka ho.
+REPORT_IMG_W, REPORT_IMG_H = 2.1, 1.8
+# Cache count se nahi, bytes se bounded hai (archive copy ke full-resolution JPEG bade hote hain);
+# eviction least-recently-used
+IMAGE_CACHE_MB = int(os.environ.get("DENGINE_IMAGE_CACHE_MB", "512"))
+
+# Photos image_worker ke sandboxed worker processes mein decode hoti hain; limits env se badal sakte hain
+IMAGE_WORKERS = min(4, os.cpu_count() or 1)
+IMAGE_TIMEOUT_S = float(os.environ.get("DENGINE_IMAGE_TIMEOUT_S", "30"))
+IMAGE_MEMORY_MB = int(os.environ.get("DENGINE_IMAGE_MEMORY_MB", "1024"))
+IMAGE_MAX_MEGAPIXELS = float(os.environ.get("DENGINE_IMAGE_MAX_MEGAPIXELS", "80"))
+IMAGE_MAX_PIXELS = int(IMAGE_MAX_MEGAPIXELS * 1_000_000)
+# Server process mein bhi (template images) yahi ek pixel ceiling rahe,
+# Pillow ki apni default limit nahi
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+@st.cache_resource
+def get_image_pool():
+    # Threads sirf decoder workers ko kaam dete aur result ka wait karte hain
+    return ThreadPoolExecutor(max_workers=IMAGE_WORKERS)
+
+@st.cache_resource
+def get_decoder_pool():
+    return image_worker.DecoderPool(IMAGE_WORKERS, IMAGE_TIMEOUT_S, IMAGE_MEMORY_MB, IMAGE_MAX_PIXELS)
+
+@st.cache_resource
+def get_image_cache():
+    # {key: Future}, {key: result bytes (sirf complete)} + lock, sab sessions ke beech shared
+    # RLock: done-callback lock pakde hue thread mein hi chal sakta hai
+    return {}, {}, threading.RLock()
+
+# Har upload ka ek entry (~100 bytes); purani sessions ke file_id yahan se nikal jaate hain
+MAX_CACHED_DIGESTS = int(os.environ.get("DENGINE_MAX_CACHED_DIGESTS", "10000"))
+
+@st.cache_resource
+def get_digest_cache():
+    # file_id -> content hash, taaki har rerun par poori file hash na karni pade
+    return {}, threading.Lock()
+
+def file_digest(img_file):
+    file_id = getattr(img_file, "file_id", None)
+    digests, lock = get_digest_cache()
+    if file_id is not None:
+        with lock:
+            if file_id in digests:
+                # LRU: abhi use hua entry aakhir mein
+                digests[file_id] = digests.pop(file_id)
+                return digests[file_id]
+    digest = hashlib.sha1(img_file.getvalue()).hexdigest()
+    if file_id is not None:
+        with lock:
+            digests[file_id] = digest
+            while len(digests) > MAX_CACHED_DIGESTS:
+                del digests[next(iter(digests))]
+    return digest
+
+def _image_done(cache, sizes, lock, key, future):
+    # Pool thread par chalta hai: yahan st.cache_resource getters nahi (ScriptRunContext nahi hota),
+    # cache prefetch_image se hi milta hai
+    images, error, transient = future.result()
+    with lock:
+        if cache.get(key) is not future:
+            return
+        if transient:
+            # Timeout / crash cache mein na rahe, warna wo photo kabhi retry nahi hogi
+            del cache[key]
+            return
+        sizes[key] = sum(len(b) for b in (images or {}).values())
+        # Purane (complete ho chuke) results hatao jab tak total limit ke andar na aa jaye
+        total = sum(sizes.values())
+        for old in list(cache):
+            if total <= IMAGE_CACHE_MB * 1024 * 1024:
+                break
+            if old in sizes:
+                total -= sizes.pop(old)
+                del cache[old]
+
+def prefetch_image(img_file, land_w=REPORT_IMG_W, land_h=REPORT_IMG_H, rendition="light"):
+    key = (file_digest(img_file), land_w, land_h, rendition)
+    cache, sizes, lock = get_image_cache()
+    decoder = get_decoder_pool()
+    with lock:
+        if key in cache:
+            # Hit entry ko aakhir mein le jao, taaki eviction sabse purane use wali se ho
+            cache[key] = cache.pop(key)
+        else:
+            # Returns (images ya None, error ya None, transient)
+            future = get_image_pool().submit(decoder.decode, img_file.getvalue(), land_w, land_h, (rendition,))
+            cache[key] = future
+            future.add_done_callback(lambda f, key=key: _image_done(cache, sizes, lock, key, f))
+        return cache[key]
+
+def get_processed_image(img_file, land_w=REPORT_IMG_W, land_h=REPORT_IMG_H, renditions=("light",)):
+    # Returns ({rendition: bytes} ya None, error ya None)
+    # Har rendition ki apni cache entry: "light" upload par hi prefetch hoti hai,
+    # "archive" sirf GENERATE par maangi jaati hai (JPEG original ho to bina decode ke)
+    futures = [prefetch_image(img_file, land_w, land_h, name) for name in renditions]
+    images = {}
+    for future in futures:
+        result, error, _ = future.result()
+        if result is None:
+            return None, error
+        images.update(result)
+    return images, None
+
+
+
+# --- TEMPLATE MEDIA SLIMMING ---
+# Client templates mein aksar full-resolution logo/cover hote hain jo har report mein copy hote hain.
+# Unhe displayed size (TEMPLATE_MEDIA_DPI par) tak chhota karke recompress karte hain.
+TEMPLATE_MEDIA_DPI = 150
+TEMPLATE_OVERSIZE_FACTOR = 1.5
+EMU_PER_INCH = 914400
+
+def _template_display_sizes(doc):
+    # {ImagePart: (max cx, max cy) in EMU} - har jagah jahan image dikhayi gayi hai.
+    # Cropped (a:srcRect) image ka sirf ek hissa dikhta hai, isliye size poori image ke hisaab se
+    # (visible fraction se bhaag dekar) nikalte hain
+    sizes = {}
+    for part in doc.part.package.iter_parts():
+        element = getattr(part, "_element", None)
+        if element is None or not hasattr(element, "xpath"):
+            continue
+        for drawing in element.xpath(".//w:drawing"):
+            extents = drawing.xpath(".//wp:extent")
+            if not extents:
+                continue
+            cx, cy = int(extents[0].get("cx")), int(extents[0].get("cy"))
+            for blip in drawing.xpath(".//a:blip[@r:embed]"):
+                image_part = part.related_parts.get(blip.get(qn("r:embed")))
+                if not isinstance(image_part, ImagePart):
+                    continue
+                full_cx, full_cy = cx, cy
+                src_rect = blip.getparent().find(qn("a:srcRect"))
+                if src_rect is not None:
+                    # l/t/r/b 1/1000 percent mein hote hain (100000 = poori image)
+                    crop = {side: int(src_rect.get(side, 0)) for side in ("l", "t", "r", "b")}
+                    visible_w = (100000 - crop["l"] - crop["r"]) / 100000
+                    visible_h = (100000 - crop["t"] - crop["b"]) / 100000
+                    if visible_w <= 0 or visible_h <= 0:
+                        continue
+                    full_cx, full_cy = math.ceil(cx / visible_w), math.ceil(cy / visible_h)
+                old_cx, old_cy = sizes.get(image_part, (0, 0))
+                sizes[image_part] = (max(old_cx, full_cx), max(old_cy, full_cy))
+    return sizes
+
+def _slim_image_blob(blob, cx, cy):
+    img = Image.open(io.BytesIO(blob))
+    fmt = img.format
+    if fmt not in ("JPEG", "PNG"):
+        return None
+    if img.size[0] * img.size[1] > IMAGE_MAX_PIXELS:
+        return None
 
+    target_w = max(1, math.ceil(cx / EMU_PER_INCH * TEMPLATE_MEDIA_DPI))
+    target_h = max(1, math.ceil(cy / EMU_PER_INCH * TEMPLATE_MEDIA_DPI))
+    if img.size[0] <= target_w * TEMPLATE_OVERSIZE_FACTOR and img.size[1] <= target_h * TEMPLATE_OVERSIZE_FACTOR:
+        return None
 
-def process_image_for_word(img_file,
-                           land_w=4.25, land_h=2.25,
-                           port_w=3.6, port_h=2.03):
-    try:
-        img = Image.open(img_file)
-        img = img.convert("RGB")
+    img.thumbnail((target_w, target_h), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    if fmt == "JPEG":
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(buf, format="JPEG", quality=85, optimize=True)
+    else:
+        img.save(buf, format="PNG", optimize=True)
+    new_blob = buf.getvalue()
+    return new_blob if len(new_blob) < len(blob) else None
+
+@st.cache_data(max_entries=10, show_spinner=False)
+def optimize_template_media(template_bytes):
+    doc = Document(io.BytesIO(template_bytes))
+    changed = False
+    for image_part, (cx, cy) in _template_display_sizes(doc).items():
+        try:
+            new_blob = _slim_image_blob(image_part.blob, cx, cy)
+        except Exception:
+            # Jo image padh nahi paaye use waise hi chhod do
+            continue
+        if new_blob:
+            image_part._blob = new_blob
+            changed = True
+    if not changed:
+        return template_bytes
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+def load_template(uploaded_template, optimize=True):
+    if optimize:
+        try:
+            return Document(io.BytesIO(optimize_template_media(uploaded_template.getvalue())))
+        except Exception:
+            pass  # Original template hi use karo
+    return Document(uploaded_template)
+
+
+# --- REPORT BUILD + MEMOIZATION ---
+# Light + archive .docx dono yahin rehte hain, isliye bhi bytes se bounded
+REPORT_CACHE_MB = int(os.environ.get("DENGINE_REPORT_CACHE_MB", "256"))
+PROJECT_FIELDS = ["p_name", "p_num", "p_loc", "p_precert", "p_area", "p_units", "p_afford", "p_date"]
+
+def report_input_hash(report):
+    # Output par asar daalne wali har cheez ka canonical hash (images = content hash)
+    def digest(f):
+        return file_digest(f) if f else None
+
+    canonical = {
+        "project": {k: str(report[k]) for k in PROJECT_FIELDS},
+        "towers": report["towers_list"],
+        "entries": [
+            [cap, stat, [digest(f) for f in imgs]]
+            for (cap, stat), imgs in group_entries(report["entries_data"]).items()
+        ],
+        "header": {
+            "logo_left": digest(report["logo_left"]),
+            "logo_right": digest(report["logo_right"]),
+            "center_text": report["header_center_text"],
+            "title": report["main_body_title"],
+            "color": report["header_color_input"],
+        },
+        "template": digest(report["uploaded_template"]),
+        "optimize_template": report["optimize_template"],
+        "captions": caption_options,
+        "image_size": [REPORT_IMG_W, REPORT_IMG_H],
+        "renditions": list(report["renditions"]),
+        "layout": report["layout"],
+    }
+    blob = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+@st.cache_resource
+def get_report_cache():
+    # {report hash: ({rendition: docx bytes}, [])} + lock; sirf bina failures wali reports
+    return {}, threading.Lock()
+
+def _report_bytes(result):
+    return sum(len(b) for b in result[0].values())
+
+def group_entries(entries_data):
+    grouped_entries = {}
+    for entry in entries_data.values():
+        key = (entry['caption'], entry['status'])
+        if key not in grouped_entries: 
+            grouped_entries[key] = []
+        grouped_entries[key].append(entry['img1'])
+        if entry['sec_imgs']: 
+            grouped_entries[key].extend(entry['sec_imgs'])
+    return grouped_entries
+
+def get_or_build_report(report):
+    report_key = report_input_hash(report)
+    cache, lock = get_report_cache()
+    with lock:
+        if report_key in cache:
+            return (report_key,) + cache[report_key]
+    result = build_report_docx(report)
+    outputs, failures = result
+    if failures:
+        # Failed photos (timeout, crash) agli baar retry ho sakein, isliye ye report cache nahi hoti
+        return (report_key,) + result
+    limit = REPORT_CACHE_MB * 1024 * 1024
+    if _report_bytes(result) > limit:
+        # Itni badi report cache mein baaki sab ko nikal degi; har baar nayi banegi
+        return (report_key,) + result
+    with lock:
+        cache[report_key] = result
+        total = sum(_report_bytes(r) for r in cache.values())
+        while total > limit:
+            total -= _report_bytes(cache.pop(next(iter(cache))))
+    return (report_key,) + result
+
+def swap_in_archive_images(doc, archive_by_sha1):
+    # Light report save hone ke baad wahi layout rakh kar sirf image parts badal do
+    partnames = {str(part.partname) for part in doc.part.package.iter_parts()}
+    for part in list(doc.part.package.iter_parts()):
+        if not isinstance(part, ImagePart) or part.sha1 not in archive_by_sha1:
+            continue
+        partname = str(part.partname)
+        new_partname = partname[:partname.rfind(".")] + ".jpeg"
+        if new_partname in partnames:
+            continue
+        part._blob = archive_by_sha1[part.sha1]
+        part.partname = PackURI(new_partname)
+        part._content_type = CT.JPEG
+        partnames.add(new_partname)
+
+def build_report_docx(report):
+    p_name, p_num, p_loc, p_precert = report["p_name"], report["p_num"], report["p_loc"], report["p_precert"]
+    p_area, p_units, p_afford, p_date = report["p_area"], report["p_units"], report["p_afford"], report["p_date"]
+    towers_list, entries_data = report["towers_list"], report["entries_data"]
+    logo_left, logo_right = report["logo_left"], report["logo_right"]
+    header_center_text, main_body_title = report["header_center_text"], report["main_body_title"]
+    header_color_input, uploaded_template = report["header_color_input"], report["uploaded_template"]
+    renditions = report["renditions"]
+    # "nested": har photo row mein andar ek table (purana layout)
+    # "flat": ek hi level ki table, photos ke liye 2 grid columns - koi nested table nahi
+    flat = report["layout"] == "flat"
+
+    if uploaded_template:
+        doc = load_template(uploaded_template, report["optimize_template"])
+        doc.add_paragraph("")
+    else:
+        doc = Document()
+        section = doc.sections[0]
+        section.left_margin = Inches(0.5)
+        section.right_margin = Inches(0.5)
+        section.top_margin = Inches(0.5) 
+        # ✅ Header ko page ke bilkul upar lao
+        section.header_distance = Inches(0.3)
+
+
+        # --- HEADER LOGIC ---
+
+        header = section.header
+        header.is_linked_to_previous = False
+        for paragraph in header.paragraphs:
+            p = paragraph._element
+            p.getparent().remove(p)
+
+        # Table ki total width 7.5 inches rakhein (A4 standard with 0.5 margins)
+        htable = header.add_table(rows=1, cols=3, width=Inches(7.5))
+
+        htable.allow_autofit = False # Ye line logo ko bahar jaane se rokegi
+
+        # Columns ki width ko strictly fix karein
+        htable.columns[0].width = Inches(1.5) # Left Logo space
+        htable.columns[1].width = Inches(4.5) # Center Text space
+        htable.columns[2].width = Inches(1.5) # Right Logo space
+
+        from docx.enum.table import WD_ROW_HEIGHT_RULE
+
+        htable.rows[0].height = Inches(0.8)  # Row height fix
+        htable.rows[0].height_rule = WD_ROW_HEIGHT_RULE.EXACTLY
+
+
+        def set_cell_padding(cell, top=100, start=100, bottom=100, end=100):
+            tc = cell._tc
+            tcPr = tc.get_or_add_tcPr()
+            tcMar = OxmlElement('w:tcMar')
+            for side, val in [('top', top), ('left', start), ('bottom', bottom), ('right', end)]:
+                node = OxmlElement(f'w:{side}')
+                node.set(qn('w:w'), str(val))
+                node.set(qn('w:type'), 'dxa')
+                tcMar.append(node)
+            tcPr.append(tcMar)
+
+        # Sabhi cells mein thoda padding add karein (approx 0.05-0.1 inch)
+        for i in range(3):
+            set_cell_padding(htable.cell(0, i), top=150, bottom=150, start=100, end=100)
+            htable.cell(0, i).vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+            # Paragraph ki extra spacing remove karein
+            p = htable.cell(0, i).paragraphs[0]
+            p.paragraph_format.space_before = Pt(0)
+            p.paragraph_format.space_after = Pt(0)
+            p.paragraph_format.line_spacing = 1.0
+
+        # 1. Left Logo (Height constrain karein)
+        if logo_left:
+            cell = htable.cell(0, 0)
+            p = cell.paragraphs[0]
+            p.alignment = WD_ALIGN_PARAGRAPH.LEFT
+            run = p.add_run()
+            p.paragraph_format.space_before = Pt(6)
+            p.paragraph_format.space_after = Pt(6)
+            img = resize_logo_exact(logo_left, 0.5, 0.5)
+            run.add_picture(img)
+
+
+            
+
+        # 2. Center Text
+        cell = htable.cell(0, 1)
+        p = cell.paragraphs[0]
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        if header_center_text:
+            run = p.add_run(header_center_text)
+            run.bold = True
+            run.font.size = Pt(9)
+
+        # 3. Right Logo (Height constrain karein)
+        if logo_right:
+            cell = htable.cell(0, 2)
+            p = cell.paragraphs[0]
+            p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+            run = p.add_run()
+            p.paragraph_format.space_before = Pt(6)
+            p.paragraph_format.space_after = Pt(6)
 
-        w_px, h_px = img.size
-        aspect = w_px / h_px
-        DPI = 96
+            img = resize_logo_exact(logo_right, 0.5, 0.5)
+            run.add_picture(img)
 
-        # 🎯 LANDSCAPE IMAGE
-        if aspect >= 1:
-            max_w_px = int(land_w * DPI)
-            max_h_px = int(land_h * DPI)
 
-            scale = min(max_w_px / w_px, max_h_px / h_px)
+            
+
+            # Header ke baad minimal gap
+            p_gap = doc.add_paragraph("")
+            p_gap.paragraph_format.space_before = Pt(0)
+            p_gap.paragraph_format.space_after = Pt(2)
+
+            # ✅ REMOVE EXTRA SPACE AFTER HEADER
+    final_header_color = header_color_input.replace('#', '')
+
+    # --- MAIN REPORT TITLE (BODY) ---
+    if main_body_title:
+        try:
+            # Title ki jagah Heading 1 (level=1) use kar rahe hain jo ki safe hai
+            head = doc.add_heading("", level=1)
+            run = head.add_run(main_body_title)
+            head.paragraph_format.space_before = Pt(0)
+            head.paragraph_format.space_after = Pt(4)
+            run.font.size = Pt(18)
+            run.font.color.rgb = RGBColor(0, 0, 0)
+            run.bold = True
+        except Exception:
+            # Agar Heading style fail ho jaye toh manual paragraph format
+            head = doc.add_paragraph()
+            run = head.add_run(main_body_title)
+            run.bold = True
+            run.font.size = Pt(32)
+            run.font.color.rgb = RGBColor(0, 0, 0)
+        
+        # Heading ko center mein align karein
+        head.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
         
-        # 🎯 PORTRAIT IMAGE
+    
+    # --- PROJECT INFO TABLE ---
+    doc.add_paragraph("")
+    info_table = doc.add_table(rows=0, cols=2)
+    info_table.style = 'Table Grid'
+    info_table.alignment = WD_TABLE_ALIGNMENT.CENTER
+    
+    details = [
+        ("Project Name", p_name),
+        ("Registration Number", p_num),   # ✅ YE LINE ADD KARO
+        ("Location", p_loc),
+        ("Pre-certification achieved", p_precert),
+        ("Total built-up area", p_area),
+        ("Total number of Dwelling Units", p_units),
+        ("Number of unit (Affordable)", p_afford),
+        ("Date", str(p_date))
+    ]
+    for lab, val in details:
+        row = info_table.add_row()
+        row.cells[0].width = Inches(2.0)
+        row.cells[1].width = Inches(4.0)
+        set_cell_background(row.cells[0], final_header_color)
+        row.cells[0].text = lab
+        p = row.cells[0].paragraphs[0]
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        run = p.runs[0]
+        run.font.bold = True
+        run.font.size = Pt(9)
+        row.cells[0].paragraphs[0].runs[0].font.color.rgb = RGBColor(0,0,0)
+        row.cells[1].text = val
+        row.cells[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+   # --- TOWER INFO TABLE (IS POORE BLOCK KO REPLACE KAREIN) ---
+    doc.add_paragraph("")
+    tower_table = doc.add_table(rows=2, cols=3)
+    tower_table.style = 'Table Grid'
+    tower_table.alignment = WD_TABLE_ALIGNMENT.CENTER
+
+    # 1. Main Merged Header (Construction status as on date)
+    main_header_cell = tower_table.rows[0].cells[0].merge(tower_table.rows[0].cells[2])
+    main_header_cell.text = f"Construction status as on ({p_date.strftime('%d-%m-%Y')})"
+    set_cell_background(main_header_cell, final_header_color)
+
+    # --- GAP KAM KARNE KE LIYE FORMATTING ---
+    p = main_header_cell.paragraphs[0]
+    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    p.paragraph_format.space_before = Pt(0) # Table ke andar upar ka gap khatam
+    p.paragraph_format.space_after = Pt(0)  # Table ke andar niche ka gap khatam
+
+    # Text ko bold karne ka sahi tarika
+    if p.runs:
+        p.runs[0].font.bold = True
+
+    # 2. Sub-headers Labels
+    sub_headers = [
+        "Tower name/number\n(For eg: Tower A, Tower A1 etc.)", 
+        "Number of floors\n(For eg.: G+1, S +3 etc.)", 
+        "Construction stage (%)"
+    ]
+
+    for i, h_text in enumerate(sub_headers):
+        cell = tower_table.rows[1].cells[i]
+        cell.text = h_text
+        set_cell_background(cell, final_header_color)
+        p = cell.paragraphs[0]
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        if p.runs:
+            p.runs[0].font.bold = True
+            p.runs[0].font.size = Pt(10)
+
+    # 3. Data Rows Loop (Yahan 'vals' wali error solve hogi)
+    for t in towers_list:
+        row = tower_table.add_row()
+        row.cells[0].text = t["name"]
+        row.cells[1].text = t["floors"]
+        row.cells[2].text = t["stage"]
+        for cell in row.cells:
+            cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+            cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+
+    doc.add_paragraph("")
+
+    # --- MAIN TABLE (AUTO-GROUPING) ---
+    grouped_entries = group_entries(entries_data)
+    failures = []
+    archive_by_sha1 = {}
+
+    def add_report_picture(cell_p, img_data):
+        images, error = get_processed_image(img_data, renditions=renditions)
+        if images:
+            run = cell_p.add_run()
+            run.add_picture(io.BytesIO(images["light"]), width=Inches(REPORT_IMG_W))
+            if "archive" in images:
+                archive_by_sha1[hashlib.sha1(images["light"]).hexdigest()] = images["archive"]
+        else:
+            failures.append((getattr(img_data, "name", "?"), error or "unreadable image"))
+
+    def photo_cells(row, count):
+        # Photo row ke cells jinmein pictures jaayengi
+        if not flat:
+            photo_cell = row.cells[2]
+            photo_cell.paragraphs[0].clear()
+            
+            # अंदर की ग्रिड टेबल
+            inner_table = photo_cell.add_table(rows=1, cols=count)
+            inner_table.allow_autofit = False
+            inner_table.width = Inches(4.5)
+            return [inner_table.cell(0, c_idx) for c_idx in range(count)]
+
+        if count == 1:
+            cells = [row.cells[2].merge(row.cells[3])]
         else:
-            max_w_px = int(port_w * DPI)
-            max_h_px = int(port_h * DPI)
+            cells = [row.cells[2], row.cells[3]]
+            # Dono photos ke beech line nahi (nested inner table jaisa)
+            hide_cell_borders(cells[0], 'right')
+            hide_cell_borders(cells[1], 'left')
+        for cell in cells:
+            # Nested layout mein table ke upar-neeche khaali paragraph hote hain; wahi height rakho
+            cell.paragraphs[0].clear()
+            cell.add_paragraph()
+            cell.add_paragraph()
+        return cells
+
+    def picture_paragraph(cell):
+        return cell.paragraphs[1] if flat else cell.paragraphs[0]
+
+    # Dono layouts mein same geometry: Credit 1.2", Status 0.8", photos 4.5" (2 x 2.25")
+    # Grid widths rows add karne se pehle set hon, taaki har body row ko bhi yahi mile
+    col_widths = (1.2, 0.8, 2.25, 2.25) if flat else (1.2, 0.8, 4.5)
+    table = doc.add_table(rows=1, cols=len(col_widths))
+    table.style = 'Table Grid'
+    table.alignment = WD_TABLE_ALIGNMENT.CENTER
+    
+    h_cells = table.rows[0].cells
+    for col, cell, width in zip(table.columns, h_cells, col_widths):
+        col.width = Inches(width)
+        cell.width = Inches(width)
+    if flat:
+        h_cells[2].merge(h_cells[3])
+        h_cells = table.rows[0].cells
+    
+    col_headers = ['Credit', 'Implementation Status (For e.g.: to be initiated,in progress, Completed)', 'Time stamp Photograph with caption']
+    for i, txt in enumerate(col_headers):
+        h_cells[i].text = txt
+        set_cell_background(h_cells[i], final_header_color)
+        p = h_cells[i].paragraphs[0]
+        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        p.runs[0].font.bold = True
+        p.runs[0].font.color.rgb = RGBColor(0,0,0)
+    
+    table.rows[0]._tr.get_or_add_trPr().append(OxmlElement('w:tblHeader'))
+
+    
+        
+# --- 1. Fixed Captions (Standard List) ---
+    # हम पहले 'caption_options' के हिसाब से फोटो लगाएंगे ताकि क्रम (Order) सही रहे
+# --- 1. Fixed Captions (Sync Logic) ---
+    for fixed_cap in caption_options:
+        relevant_keys = [k for k in grouped_entries.keys() if k[0] == fixed_cap]
 
-            scale = min(max_w_px / w_px, max_h_px / h_px)
 
-        new_w = int(w_px * scale)
-        new_h = int(h_px * scale)
 
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+            # ⭐ NEW CODE ADD KAREIN (EMPTY CAPTION ROW)
+        if not relevant_keys:
+            row = table.add_row()
+            row.cells[0].text = fixed_cap
+            row.cells[1].text = ""   # status blank
+            if flat:
+                row.cells[2].merge(row.cells[3])
+            row.cells[2].text = ""   # photo blank
 
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        buf.seek(0)
-        return buf
+            for c in row.cells:
+                c.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+                p = c.paragraphs[0]
+                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                if p.runs:
+                    p.runs[0].font.size = Pt(9)
+                    p.runs[0].font.bold = True
+            continue
 
-    except Exception:
-        return None
 
 
+        
+        for key in relevant_keys:
+            cap_text, stat_text = key
+            image_list = grouped_entries[key]
+            
+            # फोटो के 2-2 के जोड़े बनाना ताकि कैप्शन साथ रहे
+            chunk_size = 2
+            chunks = [image_list[i:i + chunk_size] for i in range(0, len(image_list), chunk_size)]
+            
+            cells_to_merge_cap = []
+            cells_to_merge_stat = []
+
+            for idx, chunk in enumerate(chunks):
+                row = table.add_row()
+                # रो को फटने से रोकना
+                row._tr.get_or_add_trPr().append(OxmlElement('w:cantSplit'))
+                
+                cells_to_merge_cap.append(row.cells[0])
+                cells_to_merge_stat.append(row.cells[1])
+
+                for cell, img_data in zip(photo_cells(row, len(chunk)), chunk):
+                    cell_p = picture_paragraph(cell)
+                    cell_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    
+                    add_report_picture(cell_p, img_data)
+
+            # कैप्शन और स्टेटस को मर्ज करना (ASLI SOLUTION)
+            cells_to_merge_cap[0].text = str(cap_text)
+            cells_to_merge_stat[0].text = str(stat_text)
+
+            # अलाइनमेंट ठीक करने के लिए (CENTER):
+            for master_cell in [cells_to_merge_cap[0], cells_to_merge_stat[0]]:
+                master_cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER  # ऊपर-नीचे से बीच में
+                p = master_cell.paragraphs[0]
+                p.alignment = WD_ALIGN_PARAGRAPH.CENTER  # दाएं-बाएं से बीच में
+                if p.runs:
+                    p.runs[0].font.size = Pt(9)
+                    p.runs[0].font.bold = True
+
+            if len(cells_to_merge_cap) > 1:
+                for i in range(1, len(cells_to_merge_cap)):
+                    cells_to_merge_cap[0].merge(cells_to_merge_cap[i])
+                    cells_to_merge_stat[0].merge(cells_to_merge_stat[i])
+
+            
+
+            # # --- YEH HISSA ADD KAREIN ---
+            # # Isse photo wale cells ki horizontal lines hat jayengi
+            # for i in range(len(cells_to_merge_cap)):
+            #     # Photo cell (index 2) ko pakdein
+            #     photo_tc = cells_to_merge_cap[i]._tr.get_children()[2] 
+            #     tcPr = photo_tc.get_or_add_tcPr()
+            #     tcBorders = OxmlElement('w:tcBorders')
+                
+            #     # Bottom aur Top border ko 'nil' (invisible) karein
+            #     for border in ['top', 'bottom']:
+            #         node = OxmlElement(f'w:{border}')
+            #         node.set(qn('w:val'), 'nil')
+            #         tcBorders.append(node)
+            #     tcPr.append(tcBorders)
+
+            
+
+            # स्टाइलिंग: टॉप एलाइनमेंट ताकि फोटो नीचे जाने पर भी नाम ऊपर रहे
+            for master_cell in [cells_to_merge_cap[0], cells_to_merge_stat[0]]:
+                master_cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+                p = master_cell.paragraphs[0]
+                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                if p.runs:
+                    p.runs[0].font.size = Pt(9)
+                    p.runs[0].font.bold = True
+
+    # --- 2. Custom Captions (वही सेम लॉजिक यहाँ भी) ---
+    custom_keys = [k for k in grouped_entries.keys() if k[0] not in caption_options]
+    for key in custom_keys:
+        cap_text, stat_text = key
+        image_list = grouped_entries[key]
+        
+        chunk_size = 2
+        chunks = [image_list[i:i + chunk_size] for i in range(0, len(image_list), chunk_size)]
+        
+        cells_to_merge_cap = []
+        cells_to_merge_stat = []
+
+        for idx, chunk in enumerate(chunks):
+            row = table.add_row()
+            row._tr.get_or_add_trPr().append(OxmlElement('w:cantSplit'))
+            cells_to_merge_cap.append(row.cells[0])
+            cells_to_merge_stat.append(row.cells[1])
+
+            for cell, img_data in zip(photo_cells(row, len(chunk)), chunk):
+                cell_p = picture_paragraph(cell)
+                cell_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                add_report_picture(cell_p, img_data)
+
+        cells_to_merge_cap[0].text = str(cap_text)
+        cells_to_merge_stat[0].text = str(stat_text)
+        if len(cells_to_merge_cap) > 1:
+            for i in range(1, len(cells_to_merge_cap)):
+                cells_to_merge_cap[0].merge(cells_to_merge_cap[i])
+                cells_to_merge_stat[0].merge(cells_to_merge_stat[i])
+
+        for master_cell in [cells_to_merge_cap[0], cells_to_merge_stat[0]]:
+            master_cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+            p = master_cell.paragraphs[0]
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            if p.runs:
+                p.runs[0].font.size = Pt(9)
+                p.runs[0].font.bold = True
+
+    # --- FINAL GENERATION ---
+    add_page_border(doc)
+    add_custom_footer(doc)
+
+    add_custom_footer(doc)                
+    add_page_border(doc)
+    outputs = {}
+    bio = io.BytesIO()
+    doc.save(bio)
+    outputs["light"] = bio.getvalue()
+
+    if "archive" in renditions:
+        swap_in_archive_images(doc, archive_by_sha1)
+        bio = io.BytesIO()
+        doc.save(bio)
+        outputs["archive"] = bio.getvalue()
+    return outputs, failures
+
+
+def show_preview(img_file, **kwargs):
+    # Preview bhi worker ki "light" rendition se banta hai, taaki upload kabhi server process
+    # mein decode na ho. Kharab file report mein "skipped" list mein aayegi
+    images, error = get_processed_image(img_file)
+    if images:
+        st.image(images["light"], **kwargs)
+    else:
+        st.caption(f"⚠️ Preview not available: {getattr(img_file, 'name', '')}")
+
 
 def inject_custom_logo(logo_filename):
     if os.path.exists(logo_filename):
@@ -321,6 +1054,17 @@ with st.sidebar:
     
     header_color_input = st.color_picker("Pick Color", "#48B448")
     uploaded_template = st.file_uploader("Upload .docx Template", type=['docx'])
+    optimize_template = st.checkbox("Shrink oversized template images", value=True)
+    if uploaded_template and optimize_template:
+        try:
+            slim = optimize_template_media(uploaded_template.getvalue())
+            st.caption(f"Template: {uploaded_template.size / 1e6:.1f} MB → {len(slim) / 1e6:.1f} MB")
+        except Exception:
+            st.caption("⚠️ Template could not be optimized, original will be used.")
+
+    archive_copy = st.checkbox("Also build full-resolution archive copy", value=False)
+    report_renditions = ("light", "archive") if archive_copy else ("light",)
+    flat_layout = st.checkbox("Flat photo table (no nested tables)", value=False)
 
 # Caption Options
 caption_options = [
@@ -346,6 +1090,9 @@ entries_data = {}
 
 if uploaded_files:
     st.write("---")
+    # Saari photos pehle hi queue mein, taaki previews ka wait workers mein parallel chale
+    for file1 in uploaded_files:
+        prefetch_image(file1)
     for i, file1 in enumerate(uploaded_files):
         with st.container():
             c_check, c_img, c_ctrl = st.columns([0.5, 2.5, 5])
@@ -356,7 +1103,7 @@ if uploaded_files:
             
             if include:
                 with c_img:
-                    st.image(file1, use_column_width=True, caption=f"Main Photo {i+1}")
+                    show_preview(file1, use_column_width=True, caption=f"Main Photo {i+1}")
                 with c_ctrl:
                     cc1, cc2 = st.columns(2)
                     with cc1:
@@ -372,10 +1119,12 @@ if uploaded_files:
                     st.markdown("**Add Grid Photos:**")
                     sec_files = st.file_uploader(f"Side images #{i+1}", type=ALL_IMG_TYPES, key=f"sec_{i}", accept_multiple_files=True)
                     if sec_files:
+                        for sf in sec_files:
+                            prefetch_image(sf)
                         p_cols = st.columns(min(len(sec_files), 4) if sec_files else 1)
                         for idx, sf in enumerate(sec_files):
                             with p_cols[idx % len(p_cols)]:
-                                st.image(sf, width=80)
+                                show_preview(sf, width=80)
 
                     if final_caption and final_caption != "Select Caption...":
                         entries_data[i] = {
@@ -391,421 +1140,28 @@ if uploaded_files:
         else:
             with st.spinner("Compiling Report..."):
                 try:
-                    if uploaded_template:
-                        doc = Document(uploaded_template)
-                        doc.add_paragraph("")
-                    else:
-                        doc = Document()
-                        section = doc.sections[0]
-                        section.left_margin = Inches(0.5)
-                        section.right_margin = Inches(0.5)
-                        section.top_margin = Inches(0.5) 
-                        # ✅ Header ko page ke bilkul upar lao
-                        section.header_distance = Inches(0.3)
-
-
-                        # --- HEADER LOGIC ---
-
-                        header = section.header
-                        header.is_linked_to_previous = False
-                        for paragraph in header.paragraphs:
-                            p = paragraph._element
-                            p.getparent().remove(p)
-
-                        # Table ki total width 7.5 inches rakhein (A4 standard with 0.5 margins)
-                        htable = header.add_table(rows=1, cols=3, width=Inches(7.5))
-
-                        htable.allow_autofit = False # Ye line logo ko bahar jaane se rokegi
-
-                        # Columns ki width ko strictly fix karein
-                        htable.columns[0].width = Inches(1.5) # Left Logo space
-                        htable.columns[1].width = Inches(4.5) # Center Text space
-                        htable.columns[2].width = Inches(1.5) # Right Logo space
-
-                        from docx.enum.table import WD_ROW_HEIGHT_RULE
-
-                        htable.rows[0].height = Inches(0.8)  # Row height fix
-                        htable.rows[0].height_rule = WD_ROW_HEIGHT_RULE.EXACTLY
-
-
-                        def set_cell_padding(cell, top=100, start=100, bottom=100, end=100):
-                            tc = cell._tc
-                            tcPr = tc.get_or_add_tcPr()
-                            tcMar = OxmlElement('w:tcMar')
-                            for side, val in [('top', top), ('left', start), ('bottom', bottom), ('right', end)]:
-                                node = OxmlElement(f'w:{side}')
-                                node.set(qn('w:w'), str(val))
-                                node.set(qn('w:type'), 'dxa')
-                                tcMar.append(node)
-                            tcPr.append(tcMar)
-
-                        # Sabhi cells mein thoda padding add karein (approx 0.05-0.1 inch)
-                        for i in range(3):
-                            set_cell_padding(htable.cell(0, i), top=150, bottom=150, start=100, end=100)
-                            htable.cell(0, i).vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                            # Paragraph ki extra spacing remove karein
-                            p = htable.cell(0, i).paragraphs[0]
-                            p.paragraph_format.space_before = Pt(0)
-                            p.paragraph_format.space_after = Pt(0)
-                            p.paragraph_format.line_spacing = 1.0
-
-                        # 1. Left Logo (Height constrain karein)
-                        if logo_left:
-                            cell = htable.cell(0, 0)
-                            p = cell.paragraphs[0]
-                            p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                            run = p.add_run()
-                            p.paragraph_format.space_before = Pt(6)
-                            p.paragraph_format.space_after = Pt(6)
-                            img = resize_logo_exact(logo_left, 0.5, 0.5)
-                            run.add_picture(img)
-
-
-                            
-
-                        # 2. Center Text
-                        cell = htable.cell(0, 1)
-                        p = cell.paragraphs[0]
-                        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        if header_center_text:
-                            run = p.add_run(header_center_text)
-                            run.bold = True
-                            run.font.size = Pt(9)
-
-                        # 3. Right Logo (Height constrain karein)
-                        if logo_right:
-                            cell = htable.cell(0, 2)
-                            p = cell.paragraphs[0]
-                            p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-                            run = p.add_run()
-                            p.paragraph_format.space_before = Pt(6)
-                            p.paragraph_format.space_after = Pt(6)
-
-                            img = resize_logo_exact(logo_right, 0.5, 0.5)
-                            run.add_picture(img)
-
-
-                            
-
-                            # Header ke baad minimal gap
-                            p_gap = doc.add_paragraph("")
-                            p_gap.paragraph_format.space_before = Pt(0)
-                            p_gap.paragraph_format.space_after = Pt(2)
-
-                            # ✅ REMOVE EXTRA SPACE AFTER HEADER
-                    final_header_color = header_color_input.replace('#', '')
-
-                    # --- MAIN REPORT TITLE (BODY) ---
-                    if main_body_title:
-                        try:
-                            # Title ki jagah Heading 1 (level=1) use kar rahe hain jo ki safe hai
-                            head = doc.add_heading("", level=1)
-                            run = head.add_run(main_body_title)
-                            head.paragraph_format.space_before = Pt(0)
-                            head.paragraph_format.space_after = Pt(4)
-                            run.font.size = Pt(18)
-                            run.font.color.rgb = RGBColor(0, 0, 0)
-                            run.bold = True
-                        except Exception:
-                            # Agar Heading style fail ho jaye toh manual paragraph format
-                            head = doc.add_paragraph()
-                            run = head.add_run(main_body_title)
-                            run.bold = True
-                            run.font.size = Pt(32)
-                            run.font.color.rgb = RGBColor(0, 0, 0)
-                        
-                        # Heading ko center mein align karein
-                        head.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-                        
-                    
-                    # --- PROJECT INFO TABLE ---
-                    doc.add_paragraph("")
-                    info_table = doc.add_table(rows=0, cols=2)
-                    info_table.style = 'Table Grid'
-                    info_table.alignment = WD_TABLE_ALIGNMENT.CENTER
-                    
-                    details = [
-                        ("Project Name", p_name),
-                        ("Registration Number", p_num),   # ✅ YE LINE ADD KARO
-                        ("Location", p_loc),
-                        ("Pre-certification achieved", p_precert),
-                        ("Total built-up area", p_area),
-                        ("Total number of Dwelling Units", p_units),
-                        ("Number of unit (Affordable)", p_afford),
-                        ("Date", str(p_date))
-                    ]
-                    for lab, val in details:
-                        row = info_table.add_row()
-                        row.cells[0].width = Inches(2.0)
-                        row.cells[1].width = Inches(4.0)
-                        set_cell_background(row.cells[0], final_header_color)
-                        row.cells[0].text = lab
-                        p = row.cells[0].paragraphs[0]
-                        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        run = p.runs[0]
-                        run.font.bold = True
-                        run.font.size = Pt(9)
-                        row.cells[0].paragraphs[0].runs[0].font.color.rgb = RGBColor(0,0,0)
-                        row.cells[1].text = val
-                        row.cells[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    
-                   # --- TOWER INFO TABLE (IS POORE BLOCK KO REPLACE KAREIN) ---
-                    doc.add_paragraph("")
-                    tower_table = doc.add_table(rows=2, cols=3)
-                    tower_table.style = 'Table Grid'
-                    tower_table.alignment = WD_TABLE_ALIGNMENT.CENTER
-
-                    # 1. Main Merged Header (Construction status as on date)
-                    main_header_cell = tower_table.rows[0].cells[0].merge(tower_table.rows[0].cells[2])
-                    main_header_cell.text = f"Construction status as on ({p_date.strftime('%d-%m-%Y')})"
-                    set_cell_background(main_header_cell, final_header_color)
-
-                    # --- GAP KAM KARNE KE LIYE FORMATTING ---
-                    p = main_header_cell.paragraphs[0]
-                    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    p.paragraph_format.space_before = Pt(0) # Table ke andar upar ka gap khatam
-                    p.paragraph_format.space_after = Pt(0)  # Table ke andar niche ka gap khatam
-
-                    # Text ko bold karne ka sahi tarika
-                    if p.runs:
-                        p.runs[0].font.bold = True
-
-                    # 2. Sub-headers Labels
-                    sub_headers = [
-                        "Tower name/number\n(For eg: Tower A, Tower A1 etc.)", 
-                        "Number of floors\n(For eg.: G+1, S +3 etc.)", 
-                        "Construction stage (%)"
-                    ]
-
-                    for i, h_text in enumerate(sub_headers):
-                        cell = tower_table.rows[1].cells[i]
-                        cell.text = h_text
-                        set_cell_background(cell, final_header_color)
-                        p = cell.paragraphs[0]
-                        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        if p.runs:
-                            p.runs[0].font.bold = True
-                            p.runs[0].font.size = Pt(10)
-
-                    # 3. Data Rows Loop (Yahan 'vals' wali error solve hogi)
-                    for t in towers_list:
-                        row = tower_table.add_row()
-                        row.cells[0].text = t["name"]
-                        row.cells[1].text = t["floors"]
-                        row.cells[2].text = t["stage"]
-                        for cell in row.cells:
-                            cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                            cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-
-                    doc.add_paragraph("")
-
-                    # --- MAIN TABLE (AUTO-GROUPING) ---
-                    grouped_entries = {}
-                    for entry in entries_data.values():
-                        key = (entry['caption'], entry['status'])
-                        if key not in grouped_entries: 
-                            grouped_entries[key] = []
-                        grouped_entries[key].append(entry['img1'])
-                        if entry['sec_imgs']: 
-                            grouped_entries[key].extend(entry['sec_imgs'])
-
-                    table = doc.add_table(rows=1, cols=3)
-                    table.style = 'Table Grid'
-                    table.alignment = WD_TABLE_ALIGNMENT.CENTER
-                    
-                    h_cells = table.rows[0].cells
-                    h_cells[0].width = Inches(1.2)
-                    h_cells[1].width = Inches(0.8)
-                    h_cells[2].width = Inches(4.5)
-                    
-                    col_headers = ['Credit', 'Implementation Status (For e.g.: to be initiated,in progress, Completed)', 'Time stamp Photograph with caption']
-                    for i, txt in enumerate(col_headers):
-                        h_cells[i].text = txt
-                        set_cell_background(h_cells[i], final_header_color)
-                        p = h_cells[i].paragraphs[0]
-                        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        p.runs[0].font.bold = True
-                        p.runs[0].font.color.rgb = RGBColor(0,0,0)
-                    
-                    table.rows[0]._tr.get_or_add_trPr().append(OxmlElement('w:tblHeader'))
-
-                    
-                        
-# --- 1. Fixed Captions (Standard List) ---
-                    # हम पहले 'caption_options' के हिसाब से फोटो लगाएंगे ताकि क्रम (Order) सही रहे
-# --- 1. Fixed Captions (Sync Logic) ---
-                    for fixed_cap in caption_options:
-                        relevant_keys = [k for k in grouped_entries.keys() if k[0] == fixed_cap]
-
-
-
-                            # ⭐ NEW CODE ADD KAREIN (EMPTY CAPTION ROW)
-                        if not relevant_keys:
-                            row = table.add_row()
-                            row.cells[0].text = fixed_cap
-                            row.cells[1].text = ""   # status blank
-                            row.cells[2].text = ""   # photo blank
-
-                            for c in row.cells:
-                                c.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                                p = c.paragraphs[0]
-                                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                if p.runs:
-                                    p.runs[0].font.size = Pt(9)
-                                    p.runs[0].font.bold = True
-                            continue
-
-
-
-                        
-                        for key in relevant_keys:
-                            cap_text, stat_text = key
-                            image_list = grouped_entries[key]
-                            
-                            # फोटो के 2-2 के जोड़े बनाना ताकि कैप्शन साथ रहे
-                            chunk_size = 2
-                            chunks = [image_list[i:i + chunk_size] for i in range(0, len(image_list), chunk_size)]
-                            
-                            cells_to_merge_cap = []
-                            cells_to_merge_stat = []
-
-                            for idx, chunk in enumerate(chunks):
-                                row = table.add_row()
-                                # रो को फटने से रोकना
-                                row._tr.get_or_add_trPr().append(OxmlElement('w:cantSplit'))
-                                
-                                cells_to_merge_cap.append(row.cells[0])
-                                cells_to_merge_stat.append(row.cells[1])
-                                
-                                photo_cell = row.cells[2]
-                                photo_cell.paragraphs[0].clear()
-                                
-                                # अंदर की ग्रिड टेबल
-                                inner_table = photo_cell.add_table(rows=1, cols=len(chunk))
-                                inner_table.allow_autofit = False
-                                inner_table.width = Inches(4.5)
-
-                                for c_idx, img_data in enumerate(chunk):
-                                    cell = inner_table.cell(0, c_idx)
-                                    cell_p = cell.paragraphs[0]
-                                    cell_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                    
-                                    img_stream = process_image_for_word(img_data, 2.1, 1.8)
-                                    if img_stream:
-                                        run = cell_p.add_run()
-                                        run.add_picture(img_stream, width=Inches(2.1))
-
-                            # कैप्शन और स्टेटस को मर्ज करना (ASLI SOLUTION)
-                            cells_to_merge_cap[0].text = str(cap_text)
-                            cells_to_merge_stat[0].text = str(stat_text)
-
-                            # अलाइनमेंट ठीक करने के लिए (CENTER):
-                            for master_cell in [cells_to_merge_cap[0], cells_to_merge_stat[0]]:
-                                master_cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER  # ऊपर-नीचे से बीच में
-                                p = master_cell.paragraphs[0]
-                                p.alignment = WD_ALIGN_PARAGRAPH.CENTER  # दाएं-बाएं से बीच में
-                                if p.runs:
-                                    p.runs[0].font.size = Pt(9)
-                                    p.runs[0].font.bold = True
-
-                            if len(cells_to_merge_cap) > 1:
-                                for i in range(1, len(cells_to_merge_cap)):
-                                    cells_to_merge_cap[0].merge(cells_to_merge_cap[i])
-                                    cells_to_merge_stat[0].merge(cells_to_merge_stat[i])
-
-                            
-
-                            # # --- YEH HISSA ADD KAREIN ---
-                            # # Isse photo wale cells ki horizontal lines hat jayengi
-                            # for i in range(len(cells_to_merge_cap)):
-                            #     # Photo cell (index 2) ko pakdein
-                            #     photo_tc = cells_to_merge_cap[i]._tr.get_children()[2] 
-                            #     tcPr = photo_tc.get_or_add_tcPr()
-                            #     tcBorders = OxmlElement('w:tcBorders')
-                                
-                            #     # Bottom aur Top border ko 'nil' (invisible) karein
-                            #     for border in ['top', 'bottom']:
-                            #         node = OxmlElement(f'w:{border}')
-                            #         node.set(qn('w:val'), 'nil')
-                            #         tcBorders.append(node)
-                            #     tcPr.append(tcBorders)
-
-                            
-
-                            # स्टाइलिंग: टॉप एलाइनमेंट ताकि फोटो नीचे जाने पर भी नाम ऊपर रहे
-                            for master_cell in [cells_to_merge_cap[0], cells_to_merge_stat[0]]:
-                                master_cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                                p = master_cell.paragraphs[0]
-                                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                if p.runs:
-                                    p.runs[0].font.size = Pt(9)
-                                    p.runs[0].font.bold = True
-
-                    # --- 2. Custom Captions (वही सेम लॉजिक यहाँ भी) ---
-                    custom_keys = [k for k in grouped_entries.keys() if k[0] not in caption_options]
-                    for key in custom_keys:
-                        cap_text, stat_text = key
-                        image_list = grouped_entries[key]
-                        
-                        chunk_size = 2
-                        chunks = [image_list[i:i + chunk_size] for i in range(0, len(image_list), chunk_size)]
-                        
-                        cells_to_merge_cap = []
-                        cells_to_merge_stat = []
-
-                        for idx, chunk in enumerate(chunks):
-                            row = table.add_row()
-                            row._tr.get_or_add_trPr().append(OxmlElement('w:cantSplit'))
-                            cells_to_merge_cap.append(row.cells[0])
-                            cells_to_merge_stat.append(row.cells[1])
-                            
-                            photo_cell = row.cells[2]
-                            photo_cell.paragraphs[0].clear()
-                            inner_table = photo_cell.add_table(rows=1, cols=len(chunk))
-                            inner_table.allow_autofit = False
-                            inner_table.width = Inches(4.5)
-
-                            for c_idx, img_data in enumerate(chunk):
-                                cell = inner_table.cell(0, c_idx)
-                                cell_p = cell.paragraphs[0]
-                                cell_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                img_stream = process_image_for_word(img_data, 2.1, 1.8)
-                                if img_stream:
-                                    run = cell_p.add_run()
-                                    run.add_picture(img_stream, width=Inches(2.1))
-
-                        cells_to_merge_cap[0].text = str(cap_text)
-                        cells_to_merge_stat[0].text = str(stat_text)
-                        if len(cells_to_merge_cap) > 1:
-                            for i in range(1, len(cells_to_merge_cap)):
-                                cells_to_merge_cap[0].merge(cells_to_merge_cap[i])
-                                cells_to_merge_stat[0].merge(cells_to_merge_stat[i])
-
-                        for master_cell in [cells_to_merge_cap[0], cells_to_merge_stat[0]]:
-                            master_cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                            p = master_cell.paragraphs[0]
-                            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                            if p.runs:
-                                p.runs[0].font.size = Pt(9)
-                                p.runs[0].font.bold = True
-
-                    # --- FINAL GENERATION ---
-                    add_page_border(doc)
-                    add_custom_footer(doc)
-
-                    target_stream = io.BytesIO()
-                    doc.save(target_stream)
-                    target_stream.seek(0)
-
-                    
-                    add_custom_footer(doc)                
-                    add_page_border(doc)
-                    bio = io.BytesIO()
-                    doc.save(bio)
+                    report = {
+                        "p_name": p_name, "p_num": p_num, "p_loc": p_loc, "p_precert": p_precert,
+                        "p_area": p_area, "p_units": p_units, "p_afford": p_afford, "p_date": p_date,
+                        "towers_list": towers_list, "entries_data": entries_data,
+                        "logo_left": logo_left, "logo_right": logo_right,
+                        "header_center_text": header_center_text, "main_body_title": main_body_title,
+                        "header_color_input": header_color_input, "uploaded_template": uploaded_template,
+                        "optimize_template": optimize_template, "renditions": report_renditions,
+                        "layout": "flat" if flat_layout else "nested",
+                    }
+                    report_key, outputs, failures = get_or_build_report(report)
                     # st.balloons()
                     st.success("🎉 Report Generated!")
-                    st.download_button("📥 DOWNLOAD REPORT", bio.getvalue(), f"IGBC_{p_name}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+                    st.caption(f"Report ID: {report_key[:12]}")
+                    if failures:
+                        st.warning(f"⚠️ {len(failures)} photo(s) could not be processed and were left out of the report.")
+                        with st.expander("Skipped / failed files"):
+                            for name, reason in failures:
+                                st.markdown(f"- **{name}**: {reason}")
+                    st.download_button("📥 DOWNLOAD REPORT", outputs["light"], f"IGBC_{p_name}.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+                    if "archive" in outputs:
+                        st.download_button("📥 DOWNLOAD ARCHIVE REPORT (full resolution)", outputs["archive"], f"IGBC_{p_name}_archive.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
 
                 except Exception as e:
                     st.error(f"Error: {e}")